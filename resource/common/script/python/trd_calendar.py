@@ -0,0 +1,102 @@
+from typing import Dict, List, Union
+import os
+import time
+import bisect
+import array
+import functools
+from pathlib import Path
+
+
+def get_curr_date() -> str:
+    return time.strftime('%Y%m%d', time.localtime())
+
+
+def next_trd_date(trd_dates: Dict[int, array.array], date: int, the_year: int) -> str:
+    if not date:
+        raise AssertionError('日期不能为空')
+    trdDateList = trd_dates.get(the_year)
+    if not trdDateList:
+        raise AssertionError(f'交易日历缺少{the_year}年的交易日列表')
+    index = bisect.bisect_right(trdDateList, date)
+    if index < len(trdDateList):
+        return str(trdDateList[index])
+    new_year = the_year + 1
+    new_trdDateList = trd_dates.get(new_year)
+    if not new_trdDateList:
+        raise AssertionError(f'交易日历缺少{new_year}年的交易日列表')
+    return str(new_trdDateList[0])
+
+
+def pre_trd_date(trd_dates: Dict[int, array.array], date: int, the_year: int) -> str:
+    if not date:
+        raise AssertionError('日期不能为空')
+    trdDateList = trd_dates.get(the_year)
+    if not trdDateList:
+        raise AssertionError(f'交易日历缺少{the_year}年的交易日列表')
+    index = bisect.bisect_left(trdDateList, date) - 1
+    if index >= 0:
+        return str(trdDateList[index])
+    last_year = the_year - 1
+    last_trdDateList = trd_dates.get(last_year)
+    if not last_trdDateList:
+        raise AssertionError(f'交易日历缺少{last_year}年的交易日列表')
+    return str(last_trdDateList[-1])
+
+
+def parse_calendar(csv_path: Union[str, Path]) -> Dict[int, array.array]:
+    """
+    导出交易日历
+
+    :param csv_path: 交易日历csv文件路径
+    :return: 交易日历, 年份 -> 按升序排列的交易日数组
+    """
+    trd_info: Dict[int, List[int]] = {}
+    try:
+        trd_csv = open(csv_path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        raise FileNotFoundError(f"没有这个文件: {csv_path}") from None
+    with trd_csv:
+        for line in trd_csv:
+            if line.startswith("#") or not line.strip():
+                continue
+            year_month_dates = line.split('|')
+            year_month, dates = year_month_dates[0].strip(), year_month_dates[1].strip().split(",")
+            trd_year = trd_info.setdefault(int(year_month[:4]), [])
+            for date in dates:
+                trd_year.append(int(year_month + date.strip().zfill(2)))
+    return {year: array.array('i', sorted(dates)) for year, dates in trd_info.items()}
+
+
+@functools.lru_cache(maxsize=8)
+def _load_calendar(csv_path: str, mtime_ns: int) -> Dict[int, array.array]:
+    return parse_calendar(csv_path)
+
+
+def load_calendar(csv_path: Union[str, Path]) -> Dict[int, array.array]:
+    """
+    加载交易日历, 同一进程内按(路径, 修改时间)缓存解析结果, 调用方不应修改返回值
+
+    :param csv_path: 交易日历csv文件路径
+    :return: 交易日历, 年份 -> 按升序排列的交易日数组
+    """
+    try:
+        mtime_ns = os.stat(csv_path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"没有这个文件: {csv_path}") from None
+    return _load_calendar(str(csv_path), mtime_ns)
+
+
+def is_trd_date(trd_dates: Dict[int, array.array], date: int, the_year: int) -> bool:
+    """
+    判断是否为交易日, 在该年升序排列的交易日数组上二分查找
+
+    :param trd_dates: 交易日历
+    :param date: 日期, 如20250102
+    :param the_year: 年份
+    :return: 是否为交易日
+    """
+    trdDateList = trd_dates.get(the_year)
+    if not trdDateList:
+        return False
+    index = bisect.bisect_left(trdDateList, date)
+    return index < len(trdDateList) and trdDateList[index] == date
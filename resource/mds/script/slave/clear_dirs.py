@@ -2,12 +2,39 @@
 import sys
 
 
+DIR_OPEN_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+
+
+def _is_dir_link(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _clear_files(dir_fd):
+    # 只删除文件, 保留目录结构; 指向目录的软链接与os.walk一致不做处理
+    # 均基于目录fd做相对操作(openat/unlinkat), 避免内核对每个文件重复解析完整路径
+    with os.scandir(dir_fd) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                sub_fd = os.open(entry.name, DIR_OPEN_FLAGS, dir_fd=dir_fd)
+                try:
+                    _clear_files(sub_fd)
+                finally:
+                    os.close(sub_fd)
+            elif not _is_dir_link(entry):
+                os.unlink(entry.name, dir_fd=dir_fd)
+
+
 def main():
     path = sys.argv[1]
     if os.path.isdir(path):
-        for root, _, files in os.walk(path):
-            for name in files:
-                os.remove(os.path.join(root, name))
+        dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            _clear_files(dir_fd)
+        finally:
+            os.close(dir_fd)
         return
     elif os.path.isfile(path):
         os.remove(path)
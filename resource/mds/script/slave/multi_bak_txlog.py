@@ -2,38 +2,65 @@ import os
 from pathlib import Path
 import time
 import tarfile
+import shutil
+import subprocess
 import argparse
-from multiprocessing import Process, Queue
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
+PIGZ_PATH = shutil.which('pigz')
 
-def _process_archive(queue: Queue, backup_path: str):
-    while True:
+
+def _tar_gz(filepath: str, tar_file: str, arcname: str, threads: int = 1):
+    if not PIGZ_PATH:
+        with tarfile.open(tar_file, 'w:gz') as tar:
+            tar.add(filepath, arcname=arcname)
+        return
+    # 有pigz时由pigz多线程压缩, tarfile只负责输出未压缩的tar流
+    pigz_args = [PIGZ_PATH, '-c', '-p', str(threads)]
+    with open(tar_file, 'wb') as f:
+        pigz = subprocess.Popen(pigz_args, stdin=subprocess.PIPE, stdout=f)
         try:
-            filepath = queue.get(block=True, timeout=0.1)
-        except Exception:
-            break
-        tar_name = os.path.basename(filepath)
-        tar_file = os.path.join(backup_path, '{}-{}'.format(tar_name, time.strftime('%Y%m%d-%H%M.tar.gz')))
-        with tarfile.open(tar_file, 'w:gz') as tar_file:
-            tar_file.add(filepath, arcname=tar_name)
-            time.sleep(0.1)
+            with tarfile.open(fileobj=pigz.stdin, mode='w|') as tar:
+                tar.add(filepath, arcname=arcname)
+        finally:
+            pigz.stdin.close()
+            pigz.wait()
+    if pigz.returncode != 0:
+        raise subprocess.CalledProcessError(pigz.returncode, pigz_args)
+
+
+def _archive_one(filepath: str, backup_path: str, threads: int = 1):
+    tar_name = os.path.basename(filepath)
+    tar_file = os.path.join(backup_path, '{}-{}'.format(tar_name, time.strftime('%Y%m%d-%H%M.tar.gz')))
+    _tar_gz(filepath, tar_file, tar_name, threads)
 
 
 def multiprocess_archive(src_path: str, backup_path: str):
-    file_queue = Queue()
-    process_list = []
+    file_list = []
     for filename in os.listdir(src_path):
         file_path = os.path.join(src_path, filename)
         if os.path.isfile(file_path):
-            file_queue.put(file_path)
-    for _ in range(10):
-        p = Process(target=_process_archive, args=(file_queue, backup_path))
-        p.daemon = True
-        p.start()
-        time.sleep(0.1)
-        process_list.append(p)
-    for p in process_list:
-        p.join()
+            file_list.append(file_path)
+    if not file_list:
+        return
+    cpu_count = os.cpu_count() or 1
+    max_workers = min(cpu_count, len(file_list))
+    # 每个进程的pigz只分到平均的cpu核数, 避免进程数与pigz线程数相乘导致cpu严重超额
+    threads = max(1, cpu_count // max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(partial(_archive_one, backup_path=backup_path, threads=threads), file_list))
+
+
+def single_archive(src_path: str, backup_path: str):
+    # 整个目录打成一个归档, 省去逐个文件的gzip初始化开销, 并可在文件之间复用压缩字典
+    tar_name = os.path.basename(os.path.normpath(src_path))
+    tar_file = os.path.join(backup_path, '{}-{}'.format(tar_name, time.strftime('%Y%m%d-%H%M.tar.gz')))
+    if PIGZ_PATH:
+        compress_args = ['--use-compress-program={} -p {}'.format(PIGZ_PATH, os.cpu_count() or 1)]
+    else:
+        compress_args = ['-z']
+    subprocess.check_call(['tar'] + compress_args + ['-cf', tar_file, '-C', src_path, '.'])
 
 
 def main():
@@ -52,6 +79,14 @@ def main():
         required=True,
         help="请输入备份路径"
     )
+    parser.add_argument(
+        "-m",
+        "--mode",
+        type=str,
+        choices=("per-file", "single"),
+        default="per-file",
+        help="备份模式: per-file为每个文件单独归档, single为整个目录打成一个归档"
+    )
     options = parser.parse_args()
     src_path = options.src_path
     backup_path = options.backup_path
@@ -59,7 +94,10 @@ def main():
         raise FileNotFoundError(f"源路径不存在: {src_path}")
     if not os.path.exists(backup_path):
         os.makedirs(backup_path, exist_ok=True)
-    multiprocess_archive(src_path, backup_path)
+    if options.mode == "single":
+        single_archive(src_path, backup_path)
+    else:
+        multiprocess_archive(src_path, backup_path)
 
 
 if __name__ == '__main__':
@@ -5,14 +5,21 @@ import subprocess
 def Run_Command(command):
     response_dict = dict()
     try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+        # 列表形式的命令直接exec, 不再额外fork一个/bin/sh; 字符串命令可能包含管道、重定向等, 仍交给shell解析
+        # 注: 目前唯一的调用方是__main__中的sys.argv[1], 传入的总是字符串, 列表分支在本仓库中不会走到,
+        # 实际效果只是用encoding参数替代了原先手动decode输出
+        result = subprocess.run(
+            command,
+            capture_output=True,
+            encoding='utf-8',
+            shell=isinstance(command, str),
+        )
     except Exception as e:
         response_dict['status'] = -1
         response_dict['response'] = e
     else:
         response_dict['status'] = result.returncode
-        response_dict['response'] = result.stdout.decode('utf-8') + '\n'
-        response_dict['response'] += result.stderr.decode('utf-8') + '\n'
+        response_dict['response'] = result.stdout + '\n' + result.stderr + '\n'
     finally:
         return response_dict
 
@@ -1,17 +1,50 @@
 import os
 import sys
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _member_parts(name):
+    # 与zipfile解压时的路径处理一致, 去掉空路径、.和..
+    return [part for part in name.split('/') if part not in ('', os.path.curdir, os.path.pardir)]
+
+
+def _plan_members(zip_paths, path):
+    # 顺序解压时后面的压缩包会覆盖前面的同名文件, 同名成员只交给最后一个压缩包解压, 避免并发写同一文件;
+    # 所有目录预先创建, 避免多线程中zipfile创建同一目录时报FileExistsError
+    owners = {}
+    dirs = set()
+    for zip_path in zip_paths:
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            for member in zip_file.infolist():
+                parts = _member_parts(member.filename)
+                if not parts:
+                    continue
+                owners["/".join(parts)] = (zip_path, member.filename)
+                dir_parts = parts if member.is_dir() else parts[:-1]
+                if dir_parts:
+                    dirs.add(os.path.join(path, *dir_parts))
+    for dir_path in sorted(dirs):
+        os.makedirs(dir_path, exist_ok=True)
+    members = {zip_path: [] for zip_path in zip_paths}
+    for zip_path, name in owners.values():
+        members[zip_path].append(name)
+    return members
+
+
+def _extract(zip_path, path, members):
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        zip_file.extractall(path, members)
 
 
 def main():
     path = sys.argv[1]
     if os.path.exists(path) and os.path.isdir(path):
-        for filename in os.listdir(path):
-            if filename.endswith('zip'):
-                zip_file = zipfile.ZipFile(os.path.join(path, filename), 'r')
-                for file in zip_file.namelist():
-                    zip_file.extract(file, path)
-                zip_file.close()
+        zip_paths = [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.zip')]
+        members = _plan_members(zip_paths, path)
+        max_workers = min(32, (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda zip_path: _extract(zip_path, path, members[zip_path]), zip_paths))
 
 
 if __name__ == '__main__':
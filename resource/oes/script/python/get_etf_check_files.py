@@ -3,14 +3,23 @@ from typing import Optional, List, Dict
 from pathlib import Path
 import time
 import argparse
-from collections import namedtuple
+import csv
 from enum import Enum
 import traceback
 
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 
 ETF_HEADER = ["etf_id", "security_id", "market", "tradable"]
+ETF_ID, SECURITY_ID, MARKET, TRADABLE = range(len(ETF_HEADER))
+
+SH_ETF_FILE_TEMPLATE = "(%(s)s{{ curr_date[4:] }}.(?i)ETF|%(s)s{{ curr_date[4:] }}2.(?i)ETF|ssepcf_%(s)s_{{ curr_date }}.xml)"
+# pcf_159942_20180201.xml
+SZ_ETF_FILE_TEMPLATE = "pcf_%(s)s_{{ curr_date }}.xml"
 
 
 class Market(Enum):
@@ -18,37 +27,32 @@ class Market(Enum):
     sz_mkt = 2
 
 
-def parse_csv(path: Path, headers: list) -> List:
-    csv_list = []
+# csv中的市场字段为文本, 预先转换避免逐行int()和枚举取值
+SH_MARKET = str(Market.sh_mkt.value)
+SZ_MARKET = str(Market.sz_mkt.value)
 
-    data_namedtuple = namedtuple("CsvLine", headers)
-    with open(path) as f:
-        for line in f:
-            if line.startswith("#") or line.strip() == "":
-                continue
 
-            line_data = [i.strip() for i in line.split("|")]
-            csv_list.append(data_namedtuple(**dict(zip(headers, line_data))))
-        return csv_list
+def parse_csv(path: Path) -> List[List[str]]:
+    with open(path, newline="") as f:
+        return [
+            [i.strip() for i in row]
+            for row in csv.reader(f, delimiter="|", quoting=csv.QUOTE_NONE)
+            if row and not row[0].startswith("#") and "".join(row).strip()
+        ]
 
 
 def get_etc_check_files(path: Path):
     sh_files = []
     sz_files = []
     try:
-        lines = parse_csv(path, headers=ETF_HEADER)
-        for line in lines:
-            if str(line.tradable) == str(0):
-                continue
-            if str(line.SecurityId) == "*":
+        for row in parse_csv(path):
+            security_id, market = row[SECURITY_ID], row[MARKET]
+            if row[TRADABLE] == "0" or security_id == "*":
                 continue
-            if int(line.market) == Market.sh_mkt.value:
-                sh_files.append(
-                    f"({line.security_id}{{{{ curr_date[4:] }}}}.(?i)ETF|{line.security_id}{{{{ curr_date[4:] }}}}2.(?i)ETF|ssepcf_{line.security_id}_{{{{ curr_date }}}}.xml)"
-                )
-            elif int(line.market) == Market.sz_mkt.value:
-                # pcf_159942_20180201.xml
-                sz_files.append(f"pcf_{line.security_id}_{{{{ curr_date }}}}.xml")
+            if market == SH_MARKET:
+                sh_files.append(SH_ETF_FILE_TEMPLATE % {"s": security_id})
+            elif market == SZ_MARKET:
+                sz_files.append(SZ_ETF_FILE_TEMPLATE % {"s": security_id})
     except Exception:
         print(traceback.format_exc())
         sh_files.append("no_such_etf_file")
@@ -59,33 +63,33 @@ def get_etc_check_files(path: Path):
 def create_sse_var_file(automatic: Dict, mon_etf_path: Path, counter_etf_path: Path, tmp_path: Path):
     sse_etf_check_mon_files = automatic["sse_etf_check_mon_files"] or []
     sse_etf_check_counter_files = automatic["sse_etf_check_counter_files"]
-    all_etf_files = automatic["sse_etf_check_files"] or []
+    all_etf_files = set(automatic["sse_etf_check_files"] or [])
     if sse_etf_check_mon_files:
         mon_etf_files, _ = get_etc_check_files(mon_etf_path)
-        all_etf_files += mon_etf_files
+        all_etf_files.update(mon_etf_files)
     if sse_etf_check_counter_files:
         counter_etf_files, _ = get_etc_check_files(counter_etf_path)
-        all_etf_files += counter_etf_files
+        all_etf_files.update(counter_etf_files)
     if not tmp_path.parent.exists():
         tmp_path.parent.mkdir(parents=True, exist_ok=True)
     with open(tmp_path, "w") as f:
-        yaml.dump({"etf_check_files": list(set(all_etf_files))}, f)
+        yaml.dump({"etf_check_files": sorted(all_etf_files)}, f, Dumper=SafeDumper)
 
 
 def create_szse_var_file(automatic: Dict, mon_etf_path: Path, counter_etf_path: Path, tmp_path: Path):
-    all_etf_files = automatic["szse_etf_check_files"] or []
+    all_etf_files = set(automatic["szse_etf_check_files"] or [])
     szse_etf_check_mon_files = automatic["szse_etf_check_mon_files"]
-    szse_etf_check_counter_files = automatic["sse_etf_check_counter_files"]
+    szse_etf_check_counter_files = automatic["szse_etf_check_counter_files"]
     if szse_etf_check_mon_files:
         _, mon_etf_files = get_etc_check_files(mon_etf_path)
-        all_etf_files += mon_etf_files
+        all_etf_files.update(mon_etf_files)
     if szse_etf_check_counter_files:
         _, counter_etf_files = get_etc_check_files(counter_etf_path)
-        all_etf_files += counter_etf_files
+        all_etf_files.update(counter_etf_files)
     if not tmp_path.parent.exists():
         tmp_path.parent.mkdir(parents=True, exist_ok=True)
     with open(tmp_path, "w") as f:
-        yaml.dump({"etf_check_files": list(set(all_etf_files))}, f)
+        yaml.dump({"etf_check_files": sorted(all_etf_files)}, f, Dumper=SafeDumper)
 
 
 def main(task: str, oes_dir: Path, colony_num: str, curr_date: Optional[str] = None):
@@ -93,7 +97,7 @@ def main(task: str, oes_dir: Path, colony_num: str, curr_date: Optional[str] = N
     if not automatic_path.exists():
         raise FileNotFoundError(f"no such file: {automatic_path}")
     with open(automatic_path, "r") as f:
-        automatic = yaml.safe_load(f)
+        automatic = yaml.load(f, Loader=SafeLoader)
     mon_etf_path = oes_dir.joinpath("mon", colony_num, "EtfTradeList.csv")
     counter_etf_path = oes_dir.joinpath("counter", colony_num, "data", "broker", f"EtfTradeList{str(curr_date)[4:]}.csv")
     if task == "sse":
@@ -1,16 +1,26 @@
 #!/usr/bin/env python3
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple, Union
 import os
 import sys
-import time
+import copy
+import array
+import json
+from collections import OrderedDict
 from pathlib import Path
 import tempfile
 import shutil
 import argparse
 
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 import ansible_runner
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[3].joinpath("common", "script", "python")))
+import trd_calendar
+
 JOBS_RECORD_ID = os.getenv("JOBS_RECORD_ID")
 if not JOBS_RECORD_ID:
     JOBS_RECORD_ID = 0
@@ -31,82 +41,53 @@ OES_DIR = STORAGE_DIR.joinpath("oes")
 RESOURCE_DIR = BASE_DIR.joinpath("resource")
 SCRIPT_DIR = RESOURCE_DIR.joinpath("oes", "script")
 PLAYBOOK_DIR = RESOURCE_DIR.joinpath("oes", "playbook")
+HOST_CONF_DIR_STR = str(HOST_CONF_DIR)
+MON_DIR_STR = str(MON_DIR)
+OES_DIR_STR = str(OES_DIR)
+SCRIPT_DIR_STR = str(SCRIPT_DIR)
+PLAYBOOK_DIR_STR = str(PLAYBOOK_DIR)
+NODE_DIR_NAMES = frozenset(("host_01", "host_02", "host_03"))
 
+YAML_CACHE_MAXSIZE = 100
+_yaml_cache: Dict[Tuple[str, int, int], Any] = OrderedDict()
+# 本进程内通过load_yaml_cached读取过的文件及其(修改时间, 文件大小), 用于校验编译后的配置
+_yaml_sources: Dict[str, Tuple[int, int]] = {}
+COMPILED_FILE_NAME = "inventory.json"
 
-def get_curr_date() -> str:
-    return time.strftime('%Y%m%d', time.localtime())
-
-
-def next_trd_date(trd_dates: Dict[str, List[int]], date: int, the_year: int) -> str:
-    if not date:
-        raise AssertionError('日期不能为空')
-    trdDateList = trd_dates.get(f'trd_date_{the_year}_list', [])
-    if not trdDateList:
-        raise AssertionError(f'交易日历缺少{the_year}年的交易日列表')
-    if date >= trdDateList[-1]:
-        new_year = the_year + 1
-        new_trdDateList = trd_dates.get(f'trd_date_{new_year}_list')
-        if not new_trdDateList:
-            raise AssertionError(f'交易日历缺少{new_year}年的交易日列表')
-        return str(new_trdDateList[0])
-    if date in trdDateList:
-        index = trdDateList.index(date)
-        next_date = trdDateList[index + 1]
-        return str(next_date)
-    else:
-        new_date = date + 1
-        if new_date in trdDateList:
-            return str(new_date)
-        return next_trd_date(trd_dates, new_date, the_year)
-
-
-def pre_trd_date(trd_dates: Dict[str, List[int]], date: int, the_year: int) -> str:
-    if not date:
-        raise AssertionError('日期不能为空')
-    trdDateList = trd_dates.get(f'trd_date_{the_year}_list', [])
-    if not trdDateList:
-        raise AssertionError(f'交易日历缺少{the_year}年的交易日列表')
-    if date <= trdDateList[0]:
-        last_year = the_year -1
-        last_trdDateList = trd_dates.get(f'trd_date_{last_year}_list')
-        if not last_trdDateList:
-            raise AssertionError(f'交易日历缺少{last_year}年的交易日列表')
-        return str(last_trdDateList[-1])
-    if date in trdDateList:
-        index = trdDateList.index(date)
-        return str(trdDateList[index - 1])
-    else:
-        last_date = date - 1
-        if last_date in trdDateList:
-            return str(last_date)
-        return pre_trd_date(trd_dates, last_date, the_year)
 
+def load_yaml_cached(path: Union[str, Path]) -> Any:
+    """
+    加载yaml文件, 以(路径, 修改时间, 文件大小)为键做LRU缓存
 
-def parse_calendar(csv_path: Path) -> Dict[str, List[int]]:
+    :param path: yaml文件路径
+    :return: yaml文件内容(顶层为dict/list时返回浅拷贝)
     """
-    导出交易日历
+    stat = os.stat(path)
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    _yaml_sources[key[0]] = (stat.st_mtime_ns, stat.st_size)
+    if key in _yaml_cache:
+        _yaml_cache.move_to_end(key)
+        return copy.copy(_yaml_cache[key])
+    with open(path, "r") as f:
+        data = yaml.load(f, Loader=SafeLoader)
+    _yaml_cache[key] = data
+    if len(_yaml_cache) > YAML_CACHE_MAXSIZE:
+        _yaml_cache.popitem(last=False)
+    return copy.copy(data)
+
 
-    :param csv_path: 交易日历csv文件路径
-    :return: 交易日历
+def get_source_stamp(path: Path) -> List:
     """
-    if not csv_path.exists():
-        raise FileNotFoundError(f"没有这个文件: {csv_path}")
-    trd_info = {}
-    with open(csv_path, 'r', encoding='utf-8') as trd_csv:
-        for line in trd_csv.readlines():
-            if line.startswith("#") or not line.strip():
-                continue
-            year_month_dates = line.split('|')
-            year_month, dates = year_month_dates[0].strip(), year_month_dates[1].rstrip('/n').strip().split(",")
-            year = year_month[:4]
-            year_key = 'trd_date_%s_list' % year
-            if not trd_info.get(year_key, None):
-                trd_info[year_key] = []
-            for date in dates:
-                date = date.zfill(2)
-                a_trd_date = year_month + date
-                trd_info[year_key].append(int(a_trd_date.strip()))
-    return trd_info
+    获取源文件的修改时间戳和大小, 文件不存在时均为-1
+
+    :param path: 文件路径
+    :return: [文件路径, 修改时间, 文件大小]
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return [str(path), -1, -1]
+    return [str(path), stat.st_mtime_ns, stat.st_size]
 
 
 def load_mon_conf(mon_id: int) -> Dict:
@@ -116,62 +97,70 @@ def load_mon_conf(mon_id: int) -> Dict:
     :param mon_id: mon主机的id
     :return: mon的配置
     """
-    mon_path = MON_DIR.joinpath("config", str(mon_id), "mon.yaml")
-    if not mon_path.exists():
-        raise FileNotFoundError(f"没有这个文件: {mon_path}")
-    with open(mon_path, "r") as f:
-        mon_vars = yaml.safe_load(f)
-    mon_host_path = HOST_CONF_DIR.joinpath(f"host_{mon_vars['host_id']}.yaml")
-    if not mon_host_path.exists():
-        raise FileNotFoundError(f"没有这个文件: {mon_host_path}")
-    with open(mon_host_path, "r") as f:
-        mon_host = yaml.safe_load(f)
-    return {**mon_vars, **mon_host}
-
-
-def init_vars(config_dir: Path, extravars: str = ""):
+    mon_path = os.path.join(MON_DIR_STR, "config", str(mon_id), "mon.yaml")
+    try:
+        mon_vars = load_yaml_cached(mon_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"没有这个文件: {mon_path}") from None
+    mon_host_path = os.path.join(HOST_CONF_DIR_STR, f"host_{mon_vars['host_id']}.yaml")
+    try:
+        mon_vars.update(load_yaml_cached(mon_host_path))
+    except FileNotFoundError:
+        raise FileNotFoundError(f"没有这个文件: {mon_host_path}") from None
+    return mon_vars
+
+
+def load_colony_vars(config_dir: Path) -> Dict:
     """
-    初始化vars配置
+    加载集群配置及其mon配置
 
-    :param config_all_path: 公共配置文件路径
-    :param extravars: 额外变量
-    :return: vars配置
+    :param config_dir: 集群配置文件目录
+    :return: 集群配置
     """
     colony_path = config_dir.joinpath("all", "colony.yaml")
-    if not colony_path.exists():
-        raise FileNotFoundError(f"没有这个文件: {colony_path}")
-    with open(colony_path, "r") as f:
-        vars = yaml.safe_load(f)
+    try:
+        vars = load_yaml_cached(colony_path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"没有这个文件: {colony_path}") from None
     if vars["is_enable"] == False:
         raise AssertionError(f"oes_{vars['colony_num']}集群被禁用")
     vars["mon_host"] = load_mon_conf(vars["mon_node_id"])
+    return vars
+
+
+def init_vars(vars: Dict, trd_dates: Optional[Dict[int, array.array]], extravars: str = "") -> Dict:
+    """
+    初始化vars配置
+
+    :param vars: 集群配置
+    :param trd_dates: 交易日历, 没有交易日历时为None
+    :param extravars: 额外变量
+    :return: vars配置
+    """
     if extravars:
         for item in extravars.split(";"):
             if "=" in item:
                 key, value = item.split("=", 1)
                 vars[key.strip()] = value.strip()
     if "curr_date" not in vars:
-        vars["curr_date"] = get_curr_date()
+        vars["curr_date"] = trd_calendar.get_curr_date()
     curr_date_int = int(vars["curr_date"])
     curr_year = int(vars["curr_date"][:4])
-    trd_data_path = OES_DIR.joinpath("mon", vars["colony_num"], "TradingCalendar.csv")
-    if trd_data_path.exists():
-        trd_dates = parse_calendar(trd_data_path)
+    if trd_dates is not None:
         if "next_trd_date" not in vars:
-            vars["next_trd_date"] = next_trd_date(trd_dates, curr_date_int, curr_year)
+            vars["next_trd_date"] = trd_calendar.next_trd_date(trd_dates, curr_date_int, curr_year)
         if "pre_trd_date" not in vars:
-            vars["pre_trd_date"] = pre_trd_date(trd_dates, curr_date_int, curr_year)
-        trd_year = trd_dates.get(f"trd_date_{curr_year}_list", [])
-        vars["is_trading_day"] = True if vars["curr_date"] in trd_year else False
+            vars["pre_trd_date"] = trd_calendar.pre_trd_date(trd_dates, curr_date_int, curr_year)
+        vars["is_trading_day"] = trd_calendar.is_trd_date(trd_dates, curr_date_int, curr_year)
     else:
         vars["next_trd_date"] = "00000000"
         vars["pre_trd_date"] = "00000000"
         vars["is_trading_day"] = False
     vars["JOBS_RECORD_ID"] = JOBS_RECORD_ID
     vars["JOBS_LOG_PATH"] = JOBS_LOG_PATH
-    vars["local_path_script_home"] = str(SCRIPT_DIR)
-    vars["local_path_playbook_home"] = str(PLAYBOOK_DIR)
-    vars["local_path_oes_home"] = str(OES_DIR)
+    vars["local_path_script_home"] = SCRIPT_DIR_STR
+    vars["local_path_playbook_home"] = PLAYBOOK_DIR_STR
+    vars["local_path_oes_home"] = OES_DIR_STR
     vars["local_python_interpreter"] = sys.executable
     return vars
 
@@ -184,35 +173,105 @@ def init_hosts(colony_num: str, config_dir: Path) -> Dict:
     :return: hosts配置
     """
     oes_cluster_hosts = {}
-    for path in config_dir.iterdir():
-        if path.is_dir() and path.name in ("host_01", "host_02", "host_03"):
-            with open(path.joinpath("node.yaml"), "r") as f:
-                node_data = yaml.safe_load(f)
-            if node_data["is_enable"] == False:
-                continue
-            host_path = HOST_CONF_DIR.joinpath(f"host_{node_data['host_id']}.yaml")
-            if not host_path.exists():
-                raise FileNotFoundError(f"没有这个文件: {host_path}")
-            with open(host_path, "r") as f:
-                host_data = yaml.safe_load(f)
-            oes_cluster_hosts[f"oes_{colony_num}_{node_data['node_role']}"] = {**node_data, **host_data}
+    with os.scandir(config_dir) as it:
+        node_dirs = [entry.path for entry in it if entry.name in NODE_DIR_NAMES and entry.is_dir()]
+    for node_dir in node_dirs:
+        node_data = load_yaml_cached(os.path.join(node_dir, "node.yaml"))
+        if node_data["is_enable"] == False:
+            continue
+        host_path = os.path.join(HOST_CONF_DIR_STR, f"host_{node_data['host_id']}.yaml")
+        host_key = f"oes_{colony_num}_{node_data['node_role']}"
+        try:
+            node_data.update(load_yaml_cached(host_path))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"没有这个文件: {host_path}") from None
+        oes_cluster_hosts[host_key] = node_data
     if len(oes_cluster_hosts) == 0:
         raise AssertionError(f"oes_{colony_num}集群没有可用的节点")
     return oes_cluster_hosts
 
 
+def build_compiled_inventory(colony_num: str, config_dir: Path) -> Dict:
+    """
+    解析集群配置并编译为json文件, 同时记录所依赖源文件的修改时间和大小
+
+    :param colony_num: oes集群编号
+    :param config_dir: 集群配置文件目录
+    :return: 编译后的配置
+    """
+    _yaml_sources.clear()
+    trd_data_path = OES_DIR.joinpath("mon", colony_num, "TradingCalendar.csv")
+    trd_data_stamp = get_source_stamp(trd_data_path)
+    sources = [
+        get_source_stamp(Path(__file__)),
+        get_source_stamp(Path(trd_calendar.__file__)),
+        get_source_stamp(config_dir),
+        trd_data_stamp,
+    ]
+    vars = load_colony_vars(config_dir)
+    hosts = init_hosts(colony_num, config_dir)
+    trd_dates = trd_calendar.load_calendar(trd_data_path) if trd_data_stamp[1] != -1 else None
+    sources.extend([path, mtime_ns, size] for path, (mtime_ns, size) in _yaml_sources.items())
+    compiled = {"vars": vars, "hosts": hosts, "trd_dates": trd_dates, "sources": sources}
+    compiled_path = OES_DIR.joinpath(".tmp", colony_num, COMPILED_FILE_NAME)
+    tmp_path = compiled_path.with_name(f"{COMPILED_FILE_NAME}.{os.getpid()}")
+    try:
+        # json会把非字符串的键转为字符串, 往返后不一致的配置不写缓存, 保证缓存命中时与直接解析结果相同
+        inventory = {"vars": vars, "hosts": hosts}
+        if json.loads(json.dumps(inventory)) != inventory:
+            return compiled
+        compiled_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump({
+                **compiled,
+                "trd_dates": None if trd_dates is None else {
+                    str(year): dates.tolist() for year, dates in trd_dates.items()
+                },
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, compiled_path)
+    except (OSError, TypeError, ValueError):
+        # 编译文件只是缓存, 写入失败不影响本次执行
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return compiled
+
+
+def load_compiled_inventory(colony_num: str) -> Optional[Dict]:
+    """
+    加载编译后的集群配置, 任一源文件发生变化时返回None
+
+    :param colony_num: oes集群编号
+    :return: 编译后的配置
+    """
+    compiled_path = OES_DIR.joinpath(".tmp", colony_num, COMPILED_FILE_NAME)
+    try:
+        with open(compiled_path, "r") as f:
+            compiled = json.load(f)
+    except (OSError, ValueError):
+        return None
+    for stamp in compiled["sources"]:
+        if get_source_stamp(Path(stamp[0])) != stamp:
+            return None
+    if compiled["trd_dates"] is not None:
+        compiled["trd_dates"] = {int(year): array.array('i', dates) for year, dates in compiled["trd_dates"].items()}
+    return compiled
+
+
 def main(options):
     playbook_path = PLAYBOOK_DIR.joinpath(options.playbook_path)
-    if not (playbook_path.exists() and playbook_path.is_file()):
+    if not playbook_path.is_file():
         raise FileNotFoundError(f"没有这个playbook文件: {playbook_path}")
     colony_num = options.colony_num
     if not colony_num:
         raise ValueError("参数colony_num是必填项")
     config_dir = OES_DIR.joinpath("config", colony_num)
-    if not config_dir.exists():
-        raise FileNotFoundError(f"没有这个目录: {config_dir}")
-    vars = init_vars(config_dir, options.extravars)
-    hosts = init_hosts(colony_num, config_dir)
+    compiled = load_compiled_inventory(colony_num)
+    if compiled is None:
+        if not config_dir.exists():
+            raise FileNotFoundError(f"没有这个目录: {config_dir}")
+        compiled = build_compiled_inventory(colony_num, config_dir)
+    vars = init_vars(compiled["vars"], compiled["trd_dates"], options.extravars)
+    hosts = compiled["hosts"]
     envvars = {}
     if options.enable_ansible_log:
         envvars["ANSIBLE_LOG_PATH"] = JOBS_LOG_PATH
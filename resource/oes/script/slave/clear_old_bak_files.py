@@ -1,8 +1,80 @@
 #!/usr/local/lib/python3.11/bin/python3.11
 import os
+import fcntl
 import optparse
-import shutil
-from datetime import datetime, date
+import resource
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date
+
+
+DIR_OPEN_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+FD_RESERVE = 4096
+UNLINK_BATCH = 256
+
+
+def _reserve_fds(limit=FD_RESERVE):
+    # 并行删除时每个线程沿目录层级同时持有多个fd, 预先提高软限制并占用最高的fd,
+    # 让内核一次性扩展好fd表, 避免多线程运行中反复扩容争用
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = limit if hard == resource.RLIM_INFINITY else min(limit, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            target = soft
+    fd = os.open(os.devnull, os.O_RDONLY)
+    try:
+        # F_DUPFD取不小于target-1的空闲fd, 不会覆盖已打开的fd
+        os.close(fcntl.fcntl(fd, fcntl.F_DUPFD, target - 1))
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _unlink_names(dir_fd, names):
+    for name in names:
+        os.unlink(name, dir_fd=dir_fd)
+
+
+def _remove_tree(dir_fd, name, unlink_executor=None):
+    # 先列出子项再删除, 删除均基于目录fd做相对操作(openat/unlinkat), 子项清空后再删除目录本身
+    sub_fd = os.open(name, DIR_OPEN_FLAGS, dir_fd=dir_fd)
+    try:
+        with os.scandir(sub_fd) as it:
+            entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+        dir_names = [entry_name for entry_name, is_dir in entries if is_dir]
+        file_names = [entry_name for entry_name, is_dir in entries if not is_dir]
+        if unlink_executor is None or len(file_names) <= UNLINK_BATCH:
+            _unlink_names(sub_fd, file_names)
+        else:
+            # 文件较多时分批交给线程池并行删除, unlink期间会释放GIL
+            batches = [file_names[i:i + UNLINK_BATCH] for i in range(0, len(file_names), UNLINK_BATCH)]
+            futures = [unlink_executor.submit(_unlink_names, sub_fd, batch) for batch in batches]
+            # 必须等所有批次结束后再关闭sub_fd, 否则仍在运行的批次可能对复用了该fd号的其他目录执行unlinkat
+            wait(futures)
+            for future in futures:
+                future.result()
+        for entry_name in dir_names:
+            _remove_tree(sub_fd, entry_name, unlink_executor)
+    finally:
+        os.close(sub_fd)
+    os.rmdir(name, dir_fd=dir_fd)
+
+
+def _purge_dir(log_dir, key_word, unlink_executor=None):
+    # key_word由调用方预先转为小写; DirEntry的类型来自getdents的d_type, 只有软链接才需要额外stat
+    dir_fd = os.open(log_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        with os.scandir(dir_fd) as it:
+            entries = [entry for entry in it if key_word in entry.name.lower()]
+        for entry in entries:
+            if entry.is_file():
+                os.unlink(entry.name, dir_fd=dir_fd)
+            elif entry.is_dir():
+                _remove_tree(dir_fd, entry.name, unlink_executor)
+    finally:
+        os.close(dir_fd)
 
 
 def main():
@@ -25,20 +97,31 @@ def main():
     )
     (options, _) = parser.parse_args()
     path = options.path.strip()
-    key_word = options.key_word.strip()
+    key_word = options.key_word.strip().lower()
     clear_data = options.clear_data
-    today = date.today()
-    for log_data in os.listdir(path):
-        d = datetime.strptime(log_data, '%Y%m%d').date()
-        if (today - d).days > clear_data:
-            log_dir = os.path.join(path, log_data)
-            for filename in os.listdir(log_dir):
-                if key_word.lower() in filename.lower():
-                    filepath = os.path.join(log_dir, filename)
-                    if os.path.isfile(filepath):
-                        os.remove(filepath)
-                    elif os.path.isdir(filepath):
-                        shutil.rmtree(filepath)
+    today = date.today().toordinal()
+    expired_dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            # 只处理YYYYMMDD格式的日期目录, 其它文件或目录直接跳过
+            name = entry.name
+            if len(name) != 8 or not name.isdigit():
+                continue
+            try:
+                d = date(int(name[:4]), int(name[4:6]), int(name[6:]))
+            except ValueError:
+                continue
+            if today - d.toordinal() > clear_data:
+                expired_dirs.append(entry.path)
+    if not expired_dirs:
+        return
+    # 各日期目录之间互不依赖, 删除为io密集型, 多线程并行清理
+    max_workers = min(32, (os.cpu_count() or 1) * 2)
+    _reserve_fds()
+    # 目录内的批量unlink使用单独的线程池, 避免日期目录的任务等待同一线程池而死锁
+    with ThreadPoolExecutor(max_workers=max_workers) as unlink_executor:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(expired_dirs))) as executor:
+            list(executor.map(lambda log_dir: _purge_dir(log_dir, key_word, unlink_executor), expired_dirs))
 
 
 if __name__ == '__main__':
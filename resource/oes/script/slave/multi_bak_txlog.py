@@ -1,39 +1,66 @@
 #!/usr/local/lib/python3.11/bin/python3.11
 import os
 import tarfile
+import shutil
+import subprocess
 import time
-from multiprocessing import Process, Queue
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import optparse
 
+PIGZ_PATH = shutil.which('pigz')
 
-def _process_archive(queue, backup_path):
-    while True:
+
+def _tar_gz(filepath, tar_file, arcname, threads=1):
+    if not PIGZ_PATH:
+        with tarfile.open(tar_file, 'w:gz') as tar:
+            tar.add(filepath, arcname=arcname)
+        return
+    # 有pigz时由pigz多线程压缩, tarfile只负责输出未压缩的tar流
+    pigz_args = [PIGZ_PATH, '-c', '-p', str(threads)]
+    with open(tar_file, 'wb') as f:
+        pigz = subprocess.Popen(pigz_args, stdin=subprocess.PIPE, stdout=f)
         try:
-            filepath = queue.get(block=True, timeout=0.1)
-        except Exception:
-            break
-        tar_name = os.path.basename(filepath)
-        tar_file = os.path.join(backup_path, '{}-{}'.format(tar_name, time.strftime('%Y%m%d-%H%M.tar.gz')))
-        with tarfile.open(tar_file, 'w:gz') as tar_file:
-            tar_file.add(filepath, arcname=tar_name)
-            time.sleep(0.1)
+            with tarfile.open(fileobj=pigz.stdin, mode='w|') as tar:
+                tar.add(filepath, arcname=arcname)
+        finally:
+            pigz.stdin.close()
+            pigz.wait()
+    if pigz.returncode != 0:
+        raise subprocess.CalledProcessError(pigz.returncode, pigz_args)
+
+
+def _archive_one(filepath, backup_path, threads=1):
+    tar_name = os.path.basename(filepath)
+    tar_file = os.path.join(backup_path, '{}-{}'.format(tar_name, time.strftime('%Y%m%d-%H%M.tar.gz')))
+    _tar_gz(filepath, tar_file, tar_name, threads)
 
 
 def multiprocess_archive(src_path, backup_path):
-    file_queue = Queue()
-    process_list = []
+    file_list = []
     for filename in os.listdir(src_path):
         file_path = os.path.join(src_path, filename)
         if os.path.isfile(file_path):
-            file_queue.put(file_path)
-    for _ in range(10):
-        p = Process(target=_process_archive, args=(file_queue, backup_path))
-        p.daemon = True
-        p.start()
-        time.sleep(0.1)
-        process_list.append(p)
-    for p in process_list:
-        p.join()
+            file_list.append(file_path)
+    if not file_list:
+        return
+    cpu_count = os.cpu_count() or 1
+    max_workers = min(cpu_count, len(file_list))
+    # 每个进程的pigz只分到平均的cpu核数, 避免进程数与pigz线程数相乘导致cpu严重超额
+    threads = max(1, cpu_count // max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(partial(_archive_one, backup_path=backup_path, threads=threads), file_list))
+
+
+def single_archive(src_path, backup_path):
+    # 整个目录打成一个归档, 省去逐个文件的gzip初始化开销, 并可在文件之间复用压缩字典
+    tar_name = os.path.basename(os.path.normpath(src_path))
+    tar_file = os.path.join(backup_path, '{}-{}'.format(tar_name, time.strftime('%Y%m%d-%H%M.tar.gz')))
+    if PIGZ_PATH:
+        compress_args = ['--use-compress-program={} -p {}'.format(PIGZ_PATH, os.cpu_count() or 1)]
+    else:
+        compress_args = ['-z']
+    subprocess.check_call(['tar'] + compress_args + ['-cf', tar_file, '-C', src_path, '.'])
 
 
 def main():
@@ -48,10 +75,20 @@ def main():
         "--backup_path",
         type="string",
     )
+    parser.add_option(
+        "-m",
+        "--mode",
+        type="choice",
+        choices=["per-file", "single"],
+        default="per-file",
+    )
     (options, _) = parser.parse_args()
     src_path = options.src_path.strip()
     backup_path = options.backup_path.strip()
-    multiprocess_archive(src_path, backup_path)
+    if options.mode == "single":
+        single_archive(src_path, backup_path)
+    else:
+        multiprocess_archive(src_path, backup_path)
 
 
 if __name__ == '__main__':
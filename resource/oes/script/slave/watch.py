@@ -2,35 +2,176 @@
 import time
 import os
 import argparse
+import re
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from watchdog.observers import Observer
+try:
+    from watchdog.observers.inotify import InotifyObserver as Observer
+except ImportError:
+    from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 
-def exec_rsync(ssh_host, ssh_port, ssh_user, src_dir, dest_dir):
-    command = "rsync -e 'ssh -p %s' -apz --delete %s/ %s@%s:%s/" % (
-        ssh_port, src_dir, ssh_user, ssh_host, dest_dir
-    )
-    print(command)
+# 复用ssh连接, 后续的rsync不再重复握手认证; 控制socket放在用户私有的~/.ssh下, 防止其他用户抢占
+SSH_CONTROL_DIR = os.path.expanduser("~/.ssh")
+SSH_CONTROL_OPTS = "-o ControlMaster=auto -o ControlPath=~/.ssh/wrsync-%C -o ControlPersist=600s"
+# 目录的同步状态: 空闲, 同步中, 同步中且又有新的变化
+SYNC_IDLE, SYNC_RUNNING, SYNC_DIRTY = range(3)
+# 编辑器产生的临时文件(vim的.swp和4913, emacs的.#和~备份), 不触发同步
+TEMP_FILE_PATTERN = re.compile(r"^\.#|~$|\.sw[a-px]$|^4913$")
+
+
+def run_rsync(command, stdin_data=None):
+    print(" ".join(command))
     try:
-        subprocess.run(command, shell=True)
+        subprocess.run(command, input=stdin_data)
     except Exception as e:
         print(e)
 
 
+def rsync_command(ssh_port, compress=False):
+    # 局域网内zlib压缩的cpu开销大于节省的传输时间, 默认不压缩
+    command = ["rsync", "-e", "ssh -p %s %s" % (ssh_port, SSH_CONTROL_OPTS), "-ap"]
+    if compress:
+        command.append("-z")
+    return command
+
+
+def exec_batch_rsync(ssh_host, ssh_port, ssh_user, base_dir, dir_names, dest_dir, compress=False):
+    # 多个目录共用一个rsync进程和ssh会话, -R配合/./保留相对路径
+    src_dirs = ["%s/./%s/" % (base_dir, dir_name) for dir_name in dir_names]
+    run_rsync(rsync_command(ssh_port, compress) + [
+        "-R", "--delete", *src_dirs, "%s@%s:%s/" % (ssh_user, ssh_host, dest_dir),
+    ])
+
+
+class SyncRoute(object):
+    # 单个同步目录的去抖和同步状态, 由FileEventHandler加锁维护
+    def __init__(self, src_dir, dst_dir, base_command, ssh_target):
+        self.src_dir = src_dir
+        self.dst_dir = dst_dir
+        self.prefix = src_dir + os.sep
+        # 预先生成rsync参数, 事件触发时直接使用; 增量同步的文件列表通过标准输入传给rsync, 不再扫描整个目录
+        src, dst = "%s/" % src_dir, "%s:%s/" % (ssh_target, dst_dir)
+        self.full_command = base_command + ["--delete", src, dst]
+        self.files_command = base_command + ["--from0", "--files-from=-", src, dst]
+        self.timer = None
+        # 本轮第一个未同步事件的时间, 用于限制持续写入时的最长等待
+        self.first_event = None
+        self.state = SYNC_IDLE
+        # 待同步的相对路径; 删除、移动和目录事件需要--delete语义, 只能全量同步
+        self.changed = set()
+        self.full_sync = False
+
+
 class FileEventHandler(FileSystemEventHandler):
-    def __init__(self, ssh_host, ssh_port, ssh_user, src_dirs, ssh_path):
-        self.ssh_host = ssh_host
-        self.ssh_port = ssh_port
-        self.ssh_user = ssh_user
-        self.ssh_path = ssh_path
-        self.src_dirs = src_dirs
+    def __init__(
+        self, ssh_host, ssh_port, ssh_user, dir_pairs, debounce=0.5, executor=None, compress=False, max_delay=5.0
+    ):
+        base_command = rsync_command(ssh_port, compress)
+        ssh_target = "%s@%s" % (ssh_user, ssh_host)
+        # 所有目录共用一个handler, 按事件路径路由到对应目录; 嵌套目录时最长的前缀优先
+        self.routes = sorted(
+            (SyncRoute(src_dir, dst_dir, base_command, ssh_target) for src_dir, dst_dir in dir_pairs),
+            key=lambda route: len(route.src_dir),
+            reverse=True,
+        )
+        # 连续的文件事件在静默debounce秒后才触发一次同步, 但距第一个事件最多等待max_delay秒,
+        # 避免txlog这类持续写入的目录一直得不到同步
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        # 与启动时的全量同步共用线程池, 多个目录的同步可以并行执行
+        self.executor = executor
         FileSystemEventHandler.__init__(self)
 
-    def on_any_event(self, event):
-        for src_dir in self.src_dirs:
-            exec_rsync(self.ssh_host, self.ssh_port, self.ssh_user, src_dir, self.ssh_path)
+    def match_route(self, path):
+        for route in self.routes:
+            if path == route.src_dir or path.startswith(route.prefix):
+                return route
+        return None
+
+    @staticmethod
+    def is_temp_file(path):
+        return TEMP_FILE_PATTERN.search(os.path.basename(path)) is not None
+
+    def on_created(self, event):
+        if not self.is_temp_file(event.src_path):
+            self.add_change(event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        # 目录的modified事件由其子项变化引起, 子项自身已有对应的事件
+        if not event.is_directory and not self.is_temp_file(event.src_path):
+            self.add_change(event.src_path, False)
+
+    def on_deleted(self, event):
+        if not self.is_temp_file(event.src_path):
+            self.add_change(event.src_path, True)
+
+    def on_moved(self, event):
+        # 源路径按删除处理, 目标路径按新建处理, 两者可能属于不同的同步目录
+        if not self.is_temp_file(event.src_path):
+            self.add_change(event.src_path, True)
+        if not self.is_temp_file(event.dest_path):
+            self.add_change(event.dest_path, event.is_directory)
+
+    def add_change(self, path, full_sync):
+        route = self.match_route(path)
+        if route is None:
+            return
+        with self._lock:
+            if full_sync:
+                route.full_sync = True
+            else:
+                route.changed.add(os.path.relpath(path, route.src_dir))
+            now = time.monotonic()
+            if route.first_event is None:
+                route.first_event = now
+            delay = min(self.debounce, max(0, route.first_event + self.max_delay - now))
+            if route.timer is not None:
+                route.timer.cancel()
+            route.timer = threading.Timer(delay, self.flush, args=(route,))
+            route.timer.daemon = True
+            route.timer.start()
+
+    def flush(self, route):
+        with self._lock:
+            # 定时器已被新的事件替换时由新的定时器负责同步
+            if route.timer is not threading.current_thread():
+                return
+            route.timer = None
+            route.first_event = None
+            # 同步进行中时只做标记, 当前同步结束后再补一次, 同一目录最多只有一个rsync
+            if route.state != SYNC_IDLE:
+                route.state = SYNC_DIRTY
+                return
+            route.state = SYNC_RUNNING
+        if self.executor is None:
+            self.sync(route)
+        else:
+            self.executor.submit(self.sync, route)
+
+    def sync(self, route):
+        while True:
+            with self._lock:
+                changed, route.changed = route.changed, set()
+                full_sync, route.full_sync = route.full_sync, False
+            try:
+                if full_sync:
+                    run_rsync(route.full_command)
+                elif changed:
+                    run_rsync(route.files_command, b"\0".join(os.fsencode(path) for path in sorted(changed)))
+            except Exception as e:
+                # 线程池中的异常不会被打印, 且必须保证状态回到空闲, 否则该目录不再同步
+                print(e)
+            with self._lock:
+                # 仍有未到期的去抖定时器说明事件还未平静, 交给定时器触发下一次同步
+                if route.state != SYNC_DIRTY or route.timer is not None:
+                    route.state = SYNC_IDLE
+                    return
+                route.state = SYNC_RUNNING
 
 
 if __name__ == "__main__":
@@ -65,24 +206,54 @@ if __name__ == "__main__":
         type=str,
         help="请输入需要同步的文件夹列表, 多个用逗号隔开"
     )
+    parser.add_argument(
+        "-t",
+        "--debounce_ms",
+        type=int,
+        default=500,
+        help="请输入文件变化后等待同步的静默时间(毫秒), 默认为500毫秒"
+    )
+    parser.add_argument(
+        "-m",
+        "--max_delay_ms",
+        type=int,
+        default=5000,
+        help="请输入文件持续变化时距第一次变化的最长同步等待时间(毫秒), 默认为5000毫秒"
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        action="store_true",
+        help="传输时启用压缩, 适用于带宽较低的链路, 默认不压缩"
+    )
     options = parser.parse_args()
     ssh_host = options.ssh_host.strip()
     ssh_port = options.ssh_port
     ssh_user = options.ssh_user.strip()
-    ssh_path = options.ssh_path.strip()
+    ssh_path = os.path.normpath(options.ssh_path.strip())
     dir_list = options.dir_list.strip()
+    debounce = options.debounce_ms / 1000
+    max_delay = options.max_delay_ms / 1000
     local_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-    observer = Observer()
+    dir_names = []
     for dir_name in dir_list.split(","):
         dir_name = dir_name.strip()
         if not dir_name:
             continue
         if dir_name.startswith("/"):
             raise Exception("文件夹名称不能使用绝对路径")
-        src_dir = os.path.join(local_path, dir_name)
-        dst_dir = os.path.join(ssh_path, dir_name)
-        exec_rsync(ssh_host, ssh_port, ssh_user, src_dir, dst_dir)
-        event_handler = FileEventHandler(ssh_host, ssh_port, ssh_user, src_dir, dst_dir)
+        # 统一规范路径, 避免目录名末尾的/导致事件路径无法匹配
+        dir_names.append(os.path.normpath(dir_name))
+    os.makedirs(SSH_CONTROL_DIR, mode=0o700, exist_ok=True)
+    if dir_names:
+        exec_batch_rsync(ssh_host, ssh_port, ssh_user, local_path, dir_names, ssh_path, options.compress)
+    dir_pairs = [(os.path.join(local_path, name), os.path.join(ssh_path, name)) for name in dir_names]
+    executor = ThreadPoolExecutor(max_workers=min(16, len(dir_pairs) or 1))
+    observer = Observer()
+    event_handler = FileEventHandler(
+        ssh_host, ssh_port, ssh_user, dir_pairs, debounce, executor, options.compress, max_delay
+    )
+    for src_dir, _ in dir_pairs:
         observer.schedule(event_handler, path=src_dir, recursive=True)
     observer.start()
     try:
@@ -91,3 +262,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    executor.shutdown()